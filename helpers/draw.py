@@ -32,12 +32,18 @@ def draw_network(network: nx.Graph):
     else:
         fig = plt.figure(figsize=(10, 10))
 
-    tx = nx.get_node_attributes(network, 'num_transmitters')
-    rx = nx.get_node_attributes(network, 'num_receivers')
+    pos = {n: n for n in network.nodes()}
 
-    nx.draw_networkx(network, pos={n: n for n in network.nodes()}, 
-        node_color = ['r' if tx[n] else 'g' if rx[n] else 'w' for n in network.nodes()], 
-        with_labels=False, node_size=50)
+    node_color = ['r' if data['num_transmitters'] else 'g' if data['num_receivers'] else 'w' 
+        for _, data in network.nodes(data=True)]
+
+    if len(network) < 1000:
+        nx.draw_networkx(network, pos=pos, node_color=node_color, 
+            with_labels=False, node_size=50)
+    else:
+        # Thin edges (drawn as a single collection) and small nodes for large networks
+        nx.draw_networkx_edges(network, pos=pos, edge_color='#cccccc', width=0.3)
+        nx.draw_networkx_nodes(network, pos=pos, node_color=node_color, node_size=10)
     plt.show()
 
 def draw_loop_comparison(results: dict, 
@@ -57,15 +63,18 @@ def draw_loop_comparison(results: dict,
     """
     fig = plt.figure(figsize=(8, 3))
 
+    means = {key: np.mean(val) for key, val in results.items()}
+    runs = len(next(iter(results.values())))    # All results are the same length
+
     for key in results:
         plt.plot(results[key], styles[key], label=key, markersize=5)
-        plt.plot(len(results[key])*[np.mean(results[key])], styles[key][0])
+        plt.axhline(means[key], color=styles[key][0])
 
     plt.xlabel("Run")
     plt.ylabel("Success Rate [%]")
     plt.legend()
-    plt.xticks(range(len(results[key])))    # All results are the same length (runs)
-    plt.suptitle(f"Network size={network_size}, Tx/Rx$\\approx${ratio}, SNRb={SNRb}")
+    plt.xticks(range(runs))
+    plt.suptitle(f"Network size={network_size}, Tx/Rx≈{ratio}, SNRb={SNRb}")
     plt.show()
 
 def draw_instantiation_times(times: dict, network_sizes: dict):
@@ -16,6 +16,8 @@ from colorama import Fore, Style
 from typing import Union
 
 import numpy as np
+import scipy.linalg
+import statistics
 import time
 import dimod
 
@@ -24,6 +26,45 @@ from helpers.draw import draw_instantiation_times
 
 ALL_METHODS = ['zero_forcing', 'matched_filter', 'MMSE']
 
+def _gram_filter(channels: np.ndarray, shift: float) -> np.ndarray:
+    """Construct the filter :math:`F^{\\dagger} (F F^{\\dagger} + shift I)^{-1}`.
+
+    Uses a Cholesky factorization of the (Hermitian) shifted Gram matrix, 
+    falling back to a pseudo-inverse if it is numerically singular or unshifted.
+
+    Args:
+        channels: Transmission channels.
+
+        shift: Diagonal shift of the Gram matrix (regularization).
+
+    Returns:
+        Filter as a matrix with a row per transmitter.
+    """
+    channels_h = channels.conj().T
+    gram = np.matmul(channels, channels_h)
+
+    # The channels of these networks are rank deficient, so only a shifted 
+    # Gram matrix can be factored
+    if shift:
+        gram.flat[::len(gram) + 1] += shift     # Diagonal, without an identity matrix
+
+        try:
+            # Channels and Gram matrix are finite by construction
+            factor, lower = scipy.linalg.cho_factor(gram, check_finite=False)
+        except np.linalg.LinAlgError:
+            factor = None
+
+        # In floating point, a numerically singular Gram matrix (e.g., a tiny 
+        # shift of rank-deficient channels) can factor with tiny pivots instead 
+        # of failing. Pivots are the squared diagonal of the Cholesky factor.
+        if factor is not None:
+            pivots = np.abs(np.diagonal(factor))**2
+            if pivots.min() >= np.sqrt(np.finfo(pivots.dtype).eps)*pivots.max():
+                return scipy.linalg.cho_solve((factor, lower), channels, 
+                    check_finite=False).conj().T
+
+    return np.matmul(channels_h, np.linalg.pinv(gram, hermitian=True))
+
 def create_filters(channels: np.ndarray, 
                    methods: list = None, 
                    snr_over_nt: float = float('inf')) -> dict:
@@ -47,9 +88,55 @@ def create_filters(channels: np.ndarray,
         methods = ALL_METHODS
     elif unknown := set(methods).difference(ALL_METHODS):
         raise ValueError(f"filter {unknown} not supported")
-    
-    return {f'{method}': dimod.generators.wireless.linear_filter(
-        channels, method=method, SNRoverNt=snr_over_nt) for method in methods}
+
+    channels_h = channels.conj().T
+
+    # Filters are views into one contiguous array so they can be applied together.
+    # They are built in double precision but stored in single precision: decoding
+    # only takes signs, and halving the memory traffic speeds up application.
+    stacked = np.empty((len(methods),) + channels_h.shape, 
+                       dtype=np.complex64 if np.iscomplexobj(channels) else np.float32)
+    # Filters are solved as dimod's ``linear_filter`` does, except that 
+    # regularized MMSE factors the (smaller) receiver-side Gram matrix rather 
+    # than taking its pseudo-inverse. Zero forcing is MMSE without 
+    # regularization (infinite signal-to-noise ratio), so filters with the same 
+    # shift share a solve, which is the pseudo-inverse of the channels if zero 
+    # forcing is requested.
+    solved = {}
+    for k, method in enumerate(methods):
+        if method == 'matched_filter':
+            stacked[k] = channels_h
+        else:
+            shift = 1/snr_over_nt if method == 'MMSE' else 0
+            if shift not in solved:
+                if shift or 'zero_forcing' not in methods:
+                    solved[shift] = _gram_filter(channels, shift)
+                else:
+                    solved[shift] = np.linalg.pinv(channels)
+            stacked[k] = solved[shift]
+
+    return {method: stacked[k] for k, method in enumerate(methods)}
+
+def _stack_filters(filters: dict) -> np.ndarray:
+    """Get filters as a single 3D array, without copying if already stacked.
+
+    Args:
+        filters: Linear filters of identical shape.
+
+    Returns:
+        Array with the filters along its first axis, in the order of the dict.
+    """
+    arrays = list(filters.values())
+    base = arrays[0].base
+
+    if (isinstance(base, np.ndarray) and 
+            base.shape == (len(arrays),) + arrays[0].shape and
+            all(array.base is base and 
+                array.__array_interface__ == view.__array_interface__ 
+                for array, view in zip(arrays, base))):
+        return base
+
+    return np.stack(arrays)
 
 def apply_filters(signal: np.ndarray, filters: dict) -> dict:
     """Decode a transmission with the given filters.
@@ -62,9 +149,35 @@ def apply_filters(signal: np.ndarray, filters: dict) -> dict:
     Returns:
         Dict of signals decoded with each of the given filters.
     """
-   
-    return {name: np.sign(np.real(np.matmul(filter, signal)))[:,0] for 
-        name, filter in filters.items()}
+    if not filters:
+        return {}
+
+    stacked = _stack_filters(filters)
+
+    # Match the filters' precision so the product does not upcast them
+    if np.iscomplexobj(signal):
+        signal = signal.astype(np.result_type(stacked, np.complex64), copy=False)
+    else:
+        signal = signal.astype(stacked.dtype, copy=False)
+
+    # A single batched product shares the signal across all filters
+    decoded = np.sign(np.real(np.matmul(stacked, signal)))[:, :, 0]
+
+    return dict(zip(filters.keys(), decoded))
+
+def _best_sample(sampleset: dimod.SampleSet) -> np.ndarray:
+    """Get the lowest-energy sample of a sample set, ordered by variable label.
+
+    Args:
+        sampleset: Samples with integer-labeled variables.
+
+    Returns:
+        Sample values as a NumPy array.
+    """
+    record = sampleset.record
+    sample = record.sample[np.argmin(record.energy)]
+
+    return sample[np.argsort(sampleset.variables)]
 
 def compare_signals(v: np.ndarray, 
                     transmission: np.ndarray, 
@@ -82,29 +195,35 @@ def compare_signals(v: np.ndarray,
         Percentage of the sequence with identical symbols (returned if `silent_return=True`).  
     """
     if isinstance(v, dict):
-        success_rate = {filter: sum(v[filter].flatten() == transmission.flatten()) 
-            for filter in v.keys()}
-        success_rate = {name: round(100*val/len(transmission)) for 
-            name, val in success_rate.items()}
+        if not v:
+            return {}
+
+        decoded = np.stack([signal.ravel() for signal in v.values()])
+        counts = np.count_nonzero(decoded == transmission.ravel(), axis=1)
+        success_rate = {name: round(100*val/transmission.size) for 
+            name, val in zip(v.keys(), counts.tolist())}
 
         if not silence_printing:
             for name in success_rate.keys():
                 print(f"{name}: decoded with a success rate of {success_rate[name]}%.")
     else:
         if isinstance(v, dimod.SampleSet):
-            received = np.array(list(v.first.sample.values()))
+            received = _best_sample(v)
         elif isinstance(v, np.ndarray):
             received = v.flatten()
         else:
             raise ValueError("Unknown signal type")
         
-        success_rate = round(100*sum(received == transmission.flatten())/len(transmission))
+        success_rate = round(100*np.count_nonzero(received == transmission.ravel())/transmission.size)
         if not silence_printing:
             print(f"Decoded with a success rate of {success_rate}%.")
 
     return success_rate
     
-def time_filter_instantiation(network_sizes: list, methods: list = None):
+def time_filter_instantiation(network_sizes: list, 
+                              methods: list = None, 
+                              n_warmup: int = 1, 
+                              n_trials: int = 5):
     """Measure the instantiation time of filters.
 
     Args:
@@ -115,10 +234,21 @@ def time_filter_instantiation(network_sizes: list, methods: list = None):
             * 'matched_filter': Matched filter.
             * 'MMSE': Minimum mean square error filter.
             * 'zero_forcing': Zero forcing filter.
+
+        n_warmup: Number of untimed instantiations of each filter.
+
+        n_trials: Number of timed instantiations of each filter. The median 
+            time is reported.
     """
+    if n_trials < 1:
+        raise ValueError(f"Minimum supported trials is 1; got {n_trials}.")
+
     if not methods:
         methods = ALL_METHODS
 
+    # Initialize BLAS threads outside the timed region
+    np.linalg.solve(np.eye(8), np.eye(8))
+
     times = {key: [] for key in methods}
     for ns in network_sizes:
 
@@ -129,9 +259,16 @@ def time_filter_instantiation(network_sizes: list, methods: list = None):
         print(f"\nFor a network of {num_tx} cellphones and {num_rx} base stations:\n")
 
         for method in methods:
-            start_t = time.time_ns()
-            create_filters(channels, methods=[method])
-            time_ms = (time.time_ns() - start_t)/1000000
+            for _ in range(n_warmup):
+                create_filters(channels, methods=[method])
+
+            trials = []
+            for _ in range(n_trials):
+                start_t = time.perf_counter_ns()
+                create_filters(channels, methods=[method])
+                trials.append((time.perf_counter_ns() - start_t)/1000000)
+
+            time_ms = statistics.median(trials)
             times[method].append(time_ms)
             if time_ms < 500:
                 print(f"\t* {method} took about {round(time_ms)} milliseconds.")
@@ -13,6 +13,7 @@
 #    limitations under the License.
 
 import numpy as np
+import scipy.sparse
 import dimod
 
 from helpers.filters import ALL_METHODS, apply_filters, compare_signals, create_filters
@@ -20,6 +21,38 @@ from dwave.samplers import SimulatedAnnealingSampler, SteepestDescentSampler, Ta
 from dwave.system import FixedEmbeddingComposite
 from helpers.network import configure_network, create_channels, print_network_stats, simulate_signals
 
+def _create_bqm(channels: np.ndarray, y: np.ndarray) -> dimod.BinaryQuadraticModel:
+    """Create a BQM for decoding a BPSK transmission.
+
+    Equivalent to dimod's ``coordinated_multipoint`` generator for the given 
+    channels and received signal, minimizing :math:`||y - F v||^2`, but without 
+    rederiving the network's attenuation matrix, which that generator discards 
+    when channels are given, or forming a dense transmitter-side Gram matrix.
+
+    Args:
+        channels: Transmission channels.
+
+        y: Received signal.
+
+    Returns:
+        Binary quadratic model with a variable per transmitter.
+    """
+    # Transmitters reach only nearby receivers so the channels are sparse
+    sparse_channels = scipy.sparse.csc_array(channels)
+    gram = (sparse_channels.conj().T @ sparse_channels).tocoo()
+
+    linear = -2*np.real(np.matmul(channels.conj().T, y))[:, 0]
+
+    # Symmetric interactions are summed into the upper triangle and, for spins, 
+    # the diagonal is constant; dimod drops interactions that cancel to zero
+    interactions = (gram.row < gram.col) & (np.real(gram.data) != 0)
+    quadratic = (gram.row[interactions], gram.col[interactions], 
+                 2*np.real(gram.data[interactions]))
+    offset = np.real(np.vdot(y, y)) + np.real(gram.diagonal()).sum()
+
+    return dimod.BinaryQuadraticModel.from_numpy_vectors(
+        linear, quadratic, offset, dimod.SPIN)
+
 def loop_comparisons(qpu: dimod.sampler, 
                      runs: int = 5, 
                      network_size: int = 16, 
@@ -59,12 +92,17 @@ def loop_comparisons(qpu: dimod.sampler,
 
     sampler_qpu = FixedEmbeddingComposite(qpu, embedding)
 
-    sampler_sa = SimulatedAnnealingSampler()
-    sampler_sd = SteepestDescentSampler()
-    sampler_tabu = TabuSampler()
+    # Classical samplers and their parameters, by solver name
+    samplers = {
+        'SA': (SimulatedAnnealingSampler(), dict(num_reads=1, num_sweeps=150)),
+        'greedy': (SteepestDescentSampler(), dict(num_reads=1)),
+        'tabu': (TabuSampler(), dict(num_reads=1, timeout=30))}
+    samplers = {name: val for name, val in samplers.items() if name in solvers}
       
     SNR=snr
 
+    methods = tuple(method for method in ALL_METHODS if method in solvers)
+
     results = {'QPU': []}
     results.update({key: [] for key in solvers})
     print("Run number: ", end="")
@@ -75,17 +113,9 @@ def loop_comparisons(qpu: dimod.sampler,
     
         channels, channel_power =  create_channels(network)
         y, transmitted_symbols = simulate_signals(channels, channel_power, SNRb=SNR)
+        symbols = transmitted_symbols.ravel()
 
-        methods = set(ALL_METHODS).intersection(solvers)
-        filters = create_filters(channels, methods=methods)
-
-        bqm = dimod.generators.wireless.coordinated_multipoint(
-            network, 
-            modulation='BPSK', 
-            transmitted_symbols=transmitted_symbols, 
-            F_distribution=('binary','real'), 
-            F=channels,
-            y=y)
+        bqm = _create_bqm(channels, y)
     
         sampleset_qpu = sampler_qpu.sample(
             bqm, 
@@ -94,28 +124,18 @@ def loop_comparisons(qpu: dimod.sampler,
             chain_strength=-0.13*min(bqm.linear.values()), 
             label='Notebook - Coordinated Multipoint')
 
-        def avg(ss, ts):
-            return round(100 * sum(np.array(list(ss.first.sample.values())) == ts.flatten()) / len(ts))
-        
-        results["QPU"].append(avg(sampleset_qpu, transmitted_symbols))
+        results["QPU"].append(compare_signals(sampleset_qpu, symbols, silence_printing=True))
     
-        v = apply_filters(y, filters)
-        filter_results = compare_signals(v, transmitted_symbols, silence_printing=True)
-        for filter in methods:
-            results[filter].append(filter_results[f'{filter}'])
-
-        # The next lines can be automated but the gain is not worth the complication
-        if 'SA' in solvers:
-            sampleset_sa = sampler_sa.sample(bqm, num_reads=1, num_sweeps=150)
-            results['SA'].append(round(100*sum(np.array(list(sampleset_sa.first.sample.values())) == transmitted_symbols.flatten())/len(transmitted_symbols)))
-
-        if 'greedy' in solvers:
-            sampleset_sd = sampler_sd.sample(bqm, num_reads=1)
-            results['greedy'].append(round(100*sum(np.array(list(sampleset_sd.first.sample.values())) == transmitted_symbols.flatten())/len(transmitted_symbols)))
-
-        if 'tabu' in solvers:
-            sampleset_tabu = sampler_tabu.sample(bqm, num_reads=1, timeout=30)
-            results['tabu'].append(round(100*sum(np.array(list(sampleset_tabu.first.sample.values())) == transmitted_symbols.flatten())/len(transmitted_symbols)))
+        if methods:
+            filters = create_filters(channels, methods=methods)
+            v = apply_filters(y, filters)
+            filter_results = compare_signals(v, transmitted_symbols, silence_printing=True)
+            for filter in methods:
+                results[filter].append(filter_results[filter])
+
+        for name, (sampler, params) in samplers.items():
+            results[name].append(compare_signals(
+                sampler.sample(bqm, **params), symbols, silence_printing=True))
 
     print("\n")
 
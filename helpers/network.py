@@ -14,14 +14,33 @@
 
 from typing import Tuple
 
+import functools
+import itertools
 import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
-import random
+import scipy.sparse
 
 import dimod
 import dwave_networkx as dnx
 
+_PC16 = dnx.pegasus_coordinates(16)
+
+_rng = np.random.default_rng()
+
+def _get_rng(seed: int = None) -> np.random.Generator:
+    """Get a random number generator.
+
+    Args:
+        seed: Seed for a new generator. If None, the module's generator is used.
+
+    Returns:
+        NumPy random number generator.
+    """
+    if seed is None:
+        return _rng
+
+    return np.random.default_rng(seed)
 
 def _num_tx_rx(network: nx.Graph) -> Tuple[int, int]:
     """"Get the number of transmitters and receivers in the given network.
@@ -37,6 +56,22 @@ def _num_tx_rx(network: nx.Graph) -> Tuple[int, int]:
 
     return num_tx, num_rx
 
+# Chains of the nodes in the first 3x3 cell, indexed by row and column parity. 
+# Other cells shift these by their cell coordinates, x and y: the first node 
+# to (0, w + x, k, z + y) and the second to (1, w + y, k, z + x)
+_CHAIN_TEMPLATES = (
+    (((0, 0, 2, 0), (1, 0, 7, 0)), 
+     ((0, 1, 0, 0), (1, 0, 2, 0)), 
+     ((0, 1, 3, 0), (1, 0, 8, 0))),
+    (((0, 0, 8, 0), (1, 0, 6, 0)), 
+     ((0, 0, 11, 0), (1, 1, 0, 0)), 
+     ((0, 0, 10, 0), (1, 0, 11, 0))),
+    (((0, 0, 7, 0), (1, 1, 4, 0)), 
+     ((0, 0, 6, 0), (1, 1, 3, 0)), 
+     ((0, 1, 4, 0), (1, 0, 10, 0))),
+)
+_CHAIN_OFFSETS = np.array(_CHAIN_TEMPLATES, dtype=np.int8)     # For vectorized gathers
+
 def _node_to_chain(row: int, col: int) -> Tuple[
     Tuple[int, int, int, int], Tuple[int, int, int, int]]: 
     """"Embed a node into a chain for a grid-with-diagonal lattice.
@@ -54,35 +89,201 @@ def _node_to_chain(row: int, col: int) -> Tuple[
     
     * https://arxiv.org/pdf/2003.00133.pdf Table 1
     """
-    row_par = row%3
-    col_par = col%3
-    x = col//3
-    y = row//3
-    if row_par == 0:
-        if col_par == 0:
-            return (0, x, 2, y), (1 ,y, 7, x)
-        elif col_par == 1:
-            return (0, x+1, 0, y), (1, y, 2, x)
-        else:
-            return (0, x+1, 3, y), (1, y, 8, x)
-    elif row_par == 1:
-        if col_par == 0:
-            return (0, x, 8, y), (1, y, 6, x)
-        elif col_par == 1:
-            return (0, x, 11, y), (1, y+1, 0, x)
-        else:
-            return (0, x, 10, y), (1, y, 11, x)
+    y, row_par = divmod(row, 3)
+    x, col_par = divmod(col, 3)
+    (u0, w0, k0, z0), (u1, w1, k1, z1) = _CHAIN_TEMPLATES[row_par][col_par]
+
+    return (u0, w0 + x, k0, z0 + y), (u1, w1 + y, k1, z1 + x)
+
+def _lattice_chains(scale: int) -> np.ndarray:
+    """Embed all nodes of a grid-with-diagonal lattice into chains.
+
+    Vectorized equivalent of :func:`_node_to_chain` over the whole lattice.
+
+    Args:
+        scale: Number of rows and columns of the lattice.
+
+    Returns:
+        Array of shape ``(scale, scale, 2, 4)`` of the two nodes, in Pegasus 
+        coordinates, that constitute the chain of each lattice node. 
+    """
+    # Coordinates are small, so narrow integers keep the gathers compact
+    row, col = np.meshgrid(np.arange(scale, dtype=np.int16), 
+        np.arange(scale, dtype=np.int16), indexing='ij')
+    y, row_par = np.divmod(row, 3)
+    x, col_par = np.divmod(col, 3)
+
+    chains = _CHAIN_OFFSETS[row_par, col_par].astype(np.int16)
+    chains[..., 0, 1] += x
+    chains[..., 0, 3] += y
+    chains[..., 1, 1] += y
+    chains[..., 1, 3] += x
+
+    return chains
+
+_NUM_QUBITS_16 = 24*16*15
+
+def _pegasus_to_linear(coords: np.ndarray) -> np.ndarray:
+    """Convert Pegasus-16 coordinates to linear indices.
+
+    Vectorized equivalent of ``pegasus_coordinates(16).pegasus_to_linear``.
+
+    Args:
+        coords: Array of Pegasus coordinates along its last axis. 
+
+    Returns:
+        Array of linear indices. 
+    """
+    u, w, k, z = np.moveaxis(np.asarray(coords, dtype=np.int64), -1, 0)
+    return ((u*16 + w)*12 + k)*15 + z
+
+def _edge_keys(node0: np.ndarray, node1: np.ndarray) -> np.ndarray:
+    """Pack edges between linear Pegasus-16 indices into integer keys.
+
+    Args:
+        node0: Linear indices of one end of the edges. 
+
+        node1: Linear indices of the other end of the edges. 
+
+    Returns:
+        Array of keys, independent of the order of the ends.
+    """
+    return np.minimum(node0, node1)*_NUM_QUBITS_16 + np.maximum(node0, node1)
+
+def _has_keys(sorted_keys: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Check membership of keys by binary search of sorted unique keys.
+
+    Args:
+        sorted_keys: Sorted array of unique keys.
+
+        keys: Array of keys to look up.
+
+    Returns:
+        Boolean array, true where a key is found. 
+    """
+    idx = np.searchsorted(sorted_keys, keys)
+    idx[idx == len(sorted_keys)] = 0
+
+    return sorted_keys[idx] == keys
+
+# Offsets from each lattice node to its preceding neighbors
+_BACK_DELTAS = np.array([(0, -1), (-1, 0), (-1, -1), (-1, 1)])
+
+def _grid_edges(scale: int) -> np.ndarray:
+    """Get all edges of a grid-with-diagonal lattice.
+
+    Args:
+        scale: Number of rows and columns of the lattice.
+
+    Returns:
+        Array of shape ``(num_edges, 2)`` of edges, as row-major indices of 
+        the lattice nodes, from each node back to its preceding neighbors. 
+        Edges are ordered by node and then by direction. 
+    """
+    row, col = np.meshgrid(np.arange(scale), np.arange(scale), indexing='ij')
+    row_back = row[..., np.newaxis] + _BACK_DELTAS[:, 0]
+    col_back = col[..., np.newaxis] + _BACK_DELTAS[:, 1]
+    valid = (row_back >= 0) & (col_back >= 0) & (col_back < scale)
+    nodes = np.broadcast_to((row*scale + col)[..., np.newaxis], valid.shape)
+
+    return np.stack((nodes[valid], (row_back*scale + col_back)[valid]), axis=1)
+
+@functools.lru_cache(maxsize=1)
+def _pegasus_16_linear() -> nx.Graph:
+    """Get the full size-16 Pegasus graph in linear coordinates.
+
+    Returns:
+        Cached graph, which must not be modified.
+    """
+    return dnx.pegasus_graph(m=16)
+
+@functools.lru_cache(maxsize=None)
+def _node_list_for_size(network_size: int) -> Tuple[int, ...]:
+    """Get the Pegasus-16 nodes that can embed a lattice of the given size.
+
+    Args:
+        network_size: Size of the lattice underlying the network, 
+            given as :math:`3*(network_size - 1)`. 
+
+    Returns:
+        Linear indices of the nodes. 
+    """
+    # Nice coordinates (t, y, x, u, k) cover a full grid of 15x15 cells, so 
+    # the nodes are enumerated directly instead of filtering a built graph
+    cells = range(min(network_size, 15))
+    nice_nodes = itertools.product(range(3), cells, cells, range(2), range(4))
+
+    return tuple(_PC16.iter_nice_to_linear(nice_nodes))
+
+def _build_target_graph(network_size: int = 16, 
+                        qpu: dimod.sampler = None) -> nx.Graph:
+    """Build the Pegasus graph available for embedding a lattice.
+
+    Args:
+        network_size: Size of the lattice underlying the network, 
+            given as :math:`3*(network_size - 1)`. 
+        qpu: QPU to which the network graph must be compatible.
+
+    Returns:
+        Target graph, in linear coordinates. 
+    """
+    node_list = _node_list_for_size(network_size)
+
+    if qpu:
+        node_list = set(node_list).intersection(qpu.nodelist)
+
+    nodes = set(node_list)
+    target = nx.Graph()
+    target.add_nodes_from(node_list)
+
+    if qpu:
+        # Couplers are a subset of the Pegasus edges, so are filtered by their 
+        # nodes alone rather than matched against a set of edges
+        target.add_edges_from((u, v) for u, v in qpu.edgelist if 
+            u in nodes and v in nodes)
     else:
-        if col_par == 0:
-            return (0, x, 7, y), (1, y+1, 4, x)
-        elif col_par == 1:
-            return (0, x, 6, y), (1, y+1, 3, x)
-        elif col_par == 2:
-            return (0, x+1, 4, y), (1, y, 10, x)
+        # Slicing the cached graph's adjacency avoids regenerating the Pegasus 
+        # topology (and is faster than NetworkX's filtered subgraph views)
+        full_adj = _pegasus_16_linear().adj
+        target.add_edges_from((u, v) for u in node_list for v in full_adj[u] if 
+            u < v and v in nodes)
+
+    return target
+
+def _target_edge_keys(target: nx.Graph) -> np.ndarray:
+    """Get the sorted edge keys of a target graph.
+
+    Args:
+        target: Target graph, in linear coordinates.
+
+    Returns:
+        Sorted array of packed keys of the graph's edges (unique, as graph 
+        edges are).
+    """
+    edges = np.fromiter(itertools.chain.from_iterable(target.edges()), 
+        dtype=np.int64, count=2*target.number_of_edges()).reshape(-1, 2)
+
+    return np.sort(_edge_keys(edges[:, 0], edges[:, 1]))
+
+@functools.lru_cache(maxsize=None)
+def _window_edge_keys(network_size: int) -> np.ndarray:
+    """Get the sorted edge keys of the full Pegasus-16 window for a lattice size.
+
+    Args:
+        network_size: Size of the lattice underlying the network, 
+            given as :math:`3*(network_size - 1)`. 
+
+    Returns:
+        Cached, read-only array of keys.
+    """
+    keys = _target_edge_keys(_build_target_graph(network_size=network_size))
+    keys.setflags(write=False)
+
+    return keys
 
 # Maintained here until Jack adds a general embedding algo to minorminer 
 def _create_lattice(network_size: int = 16, 
-                    qpu: dimod.sampler = None) -> Tuple[dict, nx.Graph]:
+                    qpu: dimod.sampler = None) -> Tuple[np.ndarray, nx.Graph]:
     """Create a lattice with an embedding
 
     Args:
@@ -91,63 +292,58 @@ def _create_lattice(network_size: int = 16,
         qpu: QPU to which the network graph must be compatible.
 
     Returns:
-        Two tuple of embedding and the source lattice. 
+        Two tuple of embedding and the source lattice. The embedding is an 
+        array with a row per lattice node, in the lattice's node order, of 
+        the linear indices of the two qubits in its chain. 
     """
-    p16_graph = dnx.pegasus_graph(m=16, nice_coordinates=True)
-    node_list = [
-        dnx.pegasus_coordinates(16).nice_to_linear(node) for node in p16_graph.nodes if 
-        node[1]<network_size and node[2]<network_size]
-    edge_list = None
-
+    # Edges are probed in bulk, by binary search of sorted keys of packed 
+    # linear indices. Only the QPU-free window is cached: QPU targets are 
+    # rebuilt so no sampler is kept alive by the cache.
     if qpu:
-        node_list = list(set(node_list).intersection(qpu.nodelist))
-        edge_list = qpu.edgelist
-        
-    qpu_graph = dnx.pegasus_graph(m=16, node_list=node_list, edge_list = edge_list)
-
-    target = nx.relabel_nodes(qpu_graph, 
-        {n: dnx.pegasus_coordinates(16).linear_to_pegasus(n) 
-        for n in qpu_graph.nodes()})
+        target_keys = _target_edge_keys(_build_target_graph(network_size=network_size, qpu=qpu))
+    else:
+        target_keys = _window_edge_keys(network_size)
 
     scale = 3*(network_size - 1)
-    emb = {}
+    linear = _pegasus_to_linear(_lattice_chains(scale).reshape(-1, 2, 4))
+    present = _has_keys(target_keys, _edge_keys(linear[:, 0], linear[:, 1]))
+
+    # Lattice edges are known in advance: keep those whose chains connect
+    edges = _grid_edges(scale)
+    edges = edges[present[edges[:, 0]] & present[edges[:, 1]]]
+
+    # Any of the four couplers between the chains' ends connects them
+    ends = linear[edges[:, 0]][:, :, np.newaxis]
+    ends_back = linear[edges[:, 1]][:, np.newaxis, :]
+    connected = _has_keys(target_keys, _edge_keys(ends, ends_back)).any(axis=(1, 2))
+
+    # A broken edge removes its preceding node, unless an earlier broken edge 
+    # already did, so defects are resolved in lattice order
+    for v, v_back in edges[~connected].tolist():
+        if present[v] and present[v_back]:
+            present[v_back] = False
+    links = edges[connected]
+    links = links[present[links[:, 0]] & present[links[:, 1]]]
+
+    # Labels of the surviving nodes are converted to Python objects in bulk, 
+    # and the lattice is loaded with one call each for nodes and edges; chains 
+    # stay in an array aligned with the nodes
+    survivors = np.flatnonzero(present)
     source = nx.Graph()
-    sourceF = nx.Graph()
-    node_defects = 0
-    edge_defects = 0
-    for row in range(scale):
-        for col in range(scale):
-            v = (row, col)
-            edge = _node_to_chain(row, col)
-            sourceF.add_node(v)
-            for delta in [(0, -1), (-1, 0), (-1, -1), (-1, 1)]:
-                v_back = (row + delta[0], col + delta[1])
-                if sourceF.has_node(v_back):
-                    sourceF.add_edge(v, v_back)
-            if target.has_edge(*edge):
-                emb[v] = edge
-                source.add_node(v)
-                #Add backwards:
-                for delta in [(0, -1), (-1, 0), (-1, -1), (-1, 1)]:
-                    v_back = (row + delta[0], col + delta[1])
-                    if source.has_node(v_back):
-                        if any(target.has_edge(v1, v2) 
-                                for v1 in emb[v] for v2 in emb[v_back]):
-                            source.add_edge(v, v_back)
-                        else:
-                            edge_defects += 1
-                            source.remove_node(v_back)
-                            del emb[v_back]
-                    else:
-                        pass
-            else:
-                node_defects += 1
-
-    return emb, source
+    source.add_nodes_from(map(tuple, np.stack(np.divmod(survivors, scale), axis=-1).tolist()))
+    source.add_edges_from((tuple(v), tuple(v_back)) for 
+        v, v_back in np.stack(np.divmod(links, scale), axis=-1).tolist())
+
+    return linear[survivors], source
+
+# Offsets of the receivers at the four corners around a transmitter, in the 
+# network's doubled lattice coordinates
+_RX_OFFSETS = np.array([(-1, -1), (-1, 1), (1, -1), (1, 1)])
 
 def configure_network(network_size: int = 16, 
                       qpu: dimod.sampler = None, 
-                      ratio: float = 1.5) -> Tuple[nx.Graph, dict]:
+                      ratio: float = 1.5, 
+                      seed: int = None) -> Tuple[nx.Graph, dict]:
     """Configure network transmitters and receivers.
 
     Args:
@@ -160,63 +356,83 @@ def configure_network(network_size: int = 16,
             a random selection of most-connected receivers to achieve the requested 
             ratio.
 
+        seed: Seed for the random selection of receivers, for reproducible 
+            networks.
+
     Returns:
-        Two-tuple of network graph and minor-embedding. 
+        Two-tuple of network graph and minor-embedding. Network nodes are 
+        labeled by integer coordinates: transmitters at even coordinates, 
+        ``(2*row, 2*col)`` of the lattice, and receivers at the odd 
+        coordinates between them.
     """
     if network_size not in range(2, 17):
         raise ValueError("Supported lattice sizes are between 4 to 16")		
 
-    emb, source = _create_lattice(network_size=network_size, qpu=qpu)
+    rng = _get_rng(seed)
+    chains, source = _create_lattice(network_size=network_size, qpu=qpu)
 
+    # Integer labels (doubled lattice coordinates) leave room for receivers 
+    # between transmitters without floating-point coordinates
+    tx_nodes = [(2*row, 2*col) for row, col in source.nodes()]
     network = nx.Graph()
-    network.add_nodes_from(source.nodes())
-    
-    nx.set_node_attributes(network, values=1,  name='num_transmitters')
-    nx.set_node_attributes(network, values=0, name='num_receivers')
-
-    # Add receiver nodes 
-    for n in list(network.nodes()):
-        network.add_nodes_from(((n[0]+x, n[1]+y) for x in [-0.5,0.5] for y in [-0.5,0.5]),
-            num_receivers=1,
-            num_transmitters=0)
-        
-        network.add_edges_from((n,(n[0]+x, n[1]+y)) 
-            for x in [-0.5,0.5] for y in [-0.5,0.5])
+    network.add_nodes_from(tx_nodes, 
+        num_transmitters=1, 
+        num_receivers=0)
+
+    # Add receiver nodes at the four corners around each transmitter
+    rx_corners = list(map(tuple, 
+        (np.array(tx_nodes)[:, np.newaxis, :] + _RX_OFFSETS).reshape(-1, 2).tolist()))
+    receivers = list(dict.fromkeys(rx_corners))     # Shared corners added once
+
+    # Boundary receivers (no ISI) are added turned off
+    rx_coords = np.array(receivers)
+    bounds = (rx_coords[:, 0].min(), rx_coords[:, 0].max())
+    rx_flags = np.where(np.isin(rx_coords, bounds).any(axis=1), 0, 1)
 
-    # Remove boundary receivers (no ISI)
-    left_bound = min(network.nodes())[0] 
-    top_bound = max(network.nodes())[0]  
-    for n in network.nodes():
-        if n[0] == left_bound or n[0] == top_bound or n[1] == left_bound or n[1] == top_bound:
-            network.nodes[n]['num_receivers'] = 0
+    network.add_nodes_from(
+        zip(receivers, ({'num_receivers': flag} for flag in rx_flags.tolist())), 
+        num_transmitters=0)
+    network.add_edges_from(zip((tx for tx in tx_nodes for _ in _RX_OFFSETS), rx_corners))
 
     # Dilute receivers to approximately the requested Tx/Rx ratio
-    rx_nodes = [n for n, v in nx.get_node_attributes(network, "num_receivers").items() if v==1]
-    tx_nodes = [n for n, v in nx.get_node_attributes(network, "num_transmitters").items() if v==1]
+    rx_nodes = [rx for rx, flag in zip(receivers, rx_flags.tolist()) if flag]
     num_tx = len(tx_nodes)
-    num_rx = len(rx_nodes)   
+    num_rx = len(rx_nodes)
     num_rx_to_delete = int(num_rx - num_tx/ratio) 
+
+    # Receivers' scores (active receivers reachable through their transmitters) 
+    # are a product with the receiver-to-receiver two-hop matrix, built once
+    tx_index = {tx: idx for idx, tx in enumerate(tx_nodes)}
+    rx_tx = [(idx, tx_index[tx]) for idx, rx in enumerate(rx_nodes) for tx in network.adj[rx]]
+    rows, cols = zip(*rx_tx) if rx_tx else ((), ())
+    incidence = scipy.sparse.csr_array((np.ones(len(rx_tx), dtype=np.int32), (rows, cols)), 
+        shape=(num_rx, num_tx))
+    rx_two_hop = (incidence @ incidence.T).tocsr()
+
+    # Small batches spread deletions evenly; at least one receiver is deleted 
+    # per round so small networks still converge
+    batch_size = max(1, int(0.02*num_tx))
+    active = np.ones(num_rx, dtype=bool)
     while num_rx_to_delete > 0.02*num_tx:
-        adj_tx_adj_rx = {rx: sum(sum(network.nodes[n]['num_receivers'] for n in network.adj[tx]) 
-            for tx in [tx for tx in network.adj[rx].keys()]) 
-                for rx in rx_nodes}
-        rx_max_adj_rx = [rx for rx, v in adj_tx_adj_rx.items() if v == max(adj_tx_adj_rx.values())]
-        rx_to_delete = random.sample(rx_max_adj_rx, min(len(rx_max_adj_rx), int(0.02*num_tx)))
-        nx.set_node_attributes(network.subgraph(rx_to_delete), values=0, name='num_receivers')         
-        rx_nodes = [n for n, v in nx.get_node_attributes(network, "num_receivers").items() if v==1]
-        num_rx_to_delete = int(len(rx_nodes) - num_tx/ratio)
+        adj_tx_adj_rx = rx_two_hop @ active.astype(np.int32)
+        max_adj_rx = adj_tx_adj_rx[active].max()
+        rx_max_adj_rx = np.flatnonzero(active & (adj_tx_adj_rx == max_adj_rx))
+        num_to_delete = min(len(rx_max_adj_rx), batch_size)
+        active[rng.choice(rx_max_adj_rx, size=num_to_delete, replace=False)] = False
+        num_rx_to_delete = int(np.count_nonzero(active) - num_tx/ratio)
+    nx.set_node_attributes(network, 
+        {rx: 0 for rx, keep in zip(rx_nodes, active) if not keep}, 
+        name='num_receivers')
         
     # Prevent disconnected transmitters 
+    nodes, adj = network.nodes, network.adj
     for tx in tx_nodes:
-        num_rx_neighbors = sum(network.nodes[n]['num_receivers'] for n in network.adj[tx])
-        if num_rx_neighbors == 0:
-            candidates = [n for n in network.adj[tx] if network.nodes[n]['num_receivers'] == 0]
-            add_rx = candidates[np.random.randint(0, len(candidates))]
-            network.nodes[add_rx]['num_receivers'] = 1
+        if not any(nodes[n]['num_receivers'] for n in adj[tx]):
+            candidates = list(adj[tx])      # All neighboring receivers are off
+            add_rx = candidates[rng.integers(len(candidates))]
+            nodes[add_rx]['num_receivers'] = 1
     
-    emb = {idx: [dnx.pegasus_coordinates(16).pegasus_to_linear(n[0]), 
-                dnx.pegasus_coordinates(16).pegasus_to_linear(n[1])] for 
-                idx, (tx, n) in enumerate(emb.items())}
+    emb = dict(enumerate(chains.tolist()))
 
     return network, emb
 
@@ -269,7 +485,8 @@ def simulate_signals(
     channels: np.ndarray, 
     channel_power: float, 
     transmitted_symbols: np.ndarray = None, 
-    SNRb: float = float('Inf')) -> Tuple[np.ndarray, np.ndarray]:
+    SNRb: float = float('Inf'), 
+    seed: int = None) -> Tuple[np.ndarray, np.ndarray]:
     """Simulate transmitted signal.
 
     Args:
@@ -281,16 +498,25 @@ def simulate_signals(
 
         SNRb: Signal-to-noise ratio.
 
+        seed: Seed for generating the transmitted symbols and noise, for 
+            reproducible transmissions.
+
     Returns:
         Two tuple of received and transmitted signals. 
     """
-    if not transmitted_symbols:
+    # Noise continues the stream of the symbols' generator rather than 
+    # restarting it from the same seed
+    rng = _get_rng(seed)
+
+    if transmitted_symbols is None:
         num_tx = channels.shape[1]
-        transmitted_symbols = np.random.choice([1, -1], size=[num_tx, 1]) 
+        # BPSK symbols need no more than 8 bits
+        transmitted_symbols = 2*rng.integers(0, 2, size=(num_tx, 1), dtype=np.int8) - 1
 
     y, v, _, _ = dimod.generators.wireless._create_signal(channels, 
         transmitted_symbols=transmitted_symbols,
         channel_power=channel_power,
-        SNRb=SNRb)
+        SNRb=SNRb,
+        random_state=rng)
 
     return y, v
\ No newline at end of file
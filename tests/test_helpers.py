@@ -0,0 +1,382 @@
+# Copyright 2023 D-Wave Systems Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import random
+import types
+import unittest
+from unittest import mock
+
+import dimod
+import dwave_networkx as dnx
+import networkx as nx
+import numpy as np
+import scipy.linalg
+
+from helpers.filters import (ALL_METHODS, apply_filters, compare_signals, create_filters, 
+    time_filter_instantiation)
+from helpers.general import _create_bqm
+from helpers.network import (_create_lattice, _node_to_chain, _num_tx_rx, 
+    configure_network, create_channels, simulate_signals)
+
+def reference_node_to_chain(row, col):
+    """Embed a node into a chain, as the original notebook did."""
+    row_par = row%3
+    col_par = col%3
+    x = col//3
+    y = row//3
+    if row_par == 0:
+        if col_par == 0:
+            return (0, x, 2, y), (1 ,y, 7, x)
+        elif col_par == 1:
+            return (0, x+1, 0, y), (1, y, 2, x)
+        else:
+            return (0, x+1, 3, y), (1, y, 8, x)
+    elif row_par == 1:
+        if col_par == 0:
+            return (0, x, 8, y), (1, y, 6, x)
+        elif col_par == 1:
+            return (0, x, 11, y), (1, y+1, 0, x)
+        else:
+            return (0, x, 10, y), (1, y, 11, x)
+    else:
+        if col_par == 0:
+            return (0, x, 7, y), (1, y+1, 4, x)
+        elif col_par == 1:
+            return (0, x, 6, y), (1, y+1, 3, x)
+        elif col_par == 2:
+            return (0, x+1, 4, y), (1, y, 10, x)
+
+def reference_lattice(network_size, qpu=None):
+    """Embed the lattice one node at a time, as the original notebook did."""
+    coords = dnx.pegasus_coordinates(16)
+    p16_graph = dnx.pegasus_graph(m=16, nice_coordinates=True)
+    node_list = [coords.nice_to_linear(node) for node in p16_graph.nodes
+                 if node[1] < network_size and node[2] < network_size]
+    edge_list = None
+
+    if qpu:
+        node_list = list(set(node_list).intersection(qpu.nodelist))
+        edge_list = qpu.edgelist
+
+    qpu_graph = dnx.pegasus_graph(m=16, node_list=node_list, edge_list=edge_list)
+    target = nx.relabel_nodes(qpu_graph,
+        {n: coords.linear_to_pegasus(n) for n in qpu_graph.nodes()})
+
+    scale = 3*(network_size - 1)
+    emb = {}
+    source = nx.Graph()
+    for row in range(scale):
+        for col in range(scale):
+            v = (row, col)
+            edge = reference_node_to_chain(row, col)
+            if not target.has_edge(*edge):
+                continue
+            emb[v] = edge
+            source.add_node(v)
+            for delta in [(0, -1), (-1, 0), (-1, -1), (-1, 1)]:
+                v_back = (row + delta[0], col + delta[1])
+                if source.has_node(v_back):
+                    if any(target.has_edge(v1, v2)
+                           for v1 in emb[v] for v2 in emb[v_back]):
+                        source.add_edge(v, v_back)
+                    else:
+                        source.remove_node(v_back)
+                        del emb[v_back]
+
+    chains = [tuple(coords.pegasus_to_linear(q) for q in emb[v]) for v in source]
+    return chains, source
+
+def reference_network(network_size, qpu=None):
+    """Place receivers around transmitters, before dilution, as the original 
+    notebook did, with coordinates doubled to match integer labels."""
+    chains, source = reference_lattice(network_size, qpu)
+
+    network = nx.Graph()
+    network.add_nodes_from(source.nodes(), num_transmitters=1, num_receivers=0)
+    for n in list(network.nodes()):
+        network.add_nodes_from(((n[0]+x, n[1]+y) for x in [-0.5,0.5] for y in [-0.5,0.5]),
+            num_receivers=1,
+            num_transmitters=0)
+        network.add_edges_from((n,(n[0]+x, n[1]+y)) 
+            for x in [-0.5,0.5] for y in [-0.5,0.5])
+
+    left_bound = min(network.nodes())[0] 
+    top_bound = max(network.nodes())[0]  
+    for n in network.nodes():
+        if n[0] == left_bound or n[0] == top_bound or n[1] == left_bound or n[1] == top_bound:
+            network.nodes[n]['num_receivers'] = 0
+
+    network = nx.relabel_nodes(network, {n: (int(2*n[0]), int(2*n[1])) for n in network})
+    emb = {idx: list(chain) for idx, chain in enumerate(chains)}
+
+    return network, emb
+
+def defective_qpu(seed=5):
+    """Pegasus-16 QPU with about 2% of its qubits and 1% of its couplers missing."""
+    rng = random.Random(seed)
+    graph = dnx.pegasus_graph(16)
+    nodes = [n for n in graph.nodes if rng.random() > 0.02]
+    edges = [e for e in graph.subgraph(nodes).edges if rng.random() > 0.01]
+
+    return types.SimpleNamespace(nodelist=sorted(nodes), edgelist=edges)
+
+class TestCreateLattice(unittest.TestCase):
+
+    def assert_same_lattice(self, network_size, qpu=None):
+        chains, source = _create_lattice(network_size, qpu)
+        ref_chains, ref_source = reference_lattice(network_size, qpu)
+
+        self.assertEqual(list(source.nodes), list(ref_source.nodes))
+        self.assertEqual(set(map(frozenset, source.edges)),
+                         set(map(frozenset, ref_source.edges)))
+        self.assertEqual(list(map(tuple, chains.tolist())), ref_chains)
+
+    def test_working_qpu(self):
+        for network_size in range(2, 17):
+            with self.subTest(network_size=network_size):
+                self.assert_same_lattice(network_size)
+
+    def test_defective_qpu(self):
+        qpu = defective_qpu()
+        for network_size in range(2, 17):
+            with self.subTest(network_size=network_size):
+                self.assert_same_lattice(network_size, qpu)
+
+    def test_node_to_chain(self):
+        nodes = list(itertools.product(range(45), repeat=2))
+
+        self.assertEqual([_node_to_chain(*node) for node in nodes], 
+                         [reference_node_to_chain(*node) for node in nodes])
+
+class TestConfigureNetwork(unittest.TestCase):
+
+    def assert_same_network(self, network_size, qpu=None):
+        # A low Tx/Rx ratio keeps all receivers, so the network is deterministic
+        network, emb = configure_network(network_size, qpu=qpu, ratio=0.01)
+        ref_network, ref_emb = reference_network(network_size, qpu)
+
+        self.assertEqual(list(network.nodes(data=True)), 
+                         list(ref_network.nodes(data=True)))
+        self.assertEqual(set(map(frozenset, network.edges)),
+                         set(map(frozenset, ref_network.edges)))
+        self.assertEqual(emb, ref_emb)
+
+    def test_working_qpu(self):
+        for network_size in range(2, 17):
+            with self.subTest(network_size=network_size):
+                self.assert_same_network(network_size)
+
+    def test_defective_qpu(self):
+        qpu = defective_qpu()
+        for network_size in range(2, 17):
+            with self.subTest(network_size=network_size):
+                self.assert_same_network(network_size, qpu)
+
+    def test_dilution(self):
+        ratio = 1.5
+        for network_size, qpu in itertools.product([4, 8, 16], [None, defective_qpu()]):
+            with self.subTest(network_size=network_size, qpu=bool(qpu)):
+                network, _ = configure_network(network_size, qpu=qpu, ratio=ratio, seed=0)
+                num_tx, num_rx = _num_tx_rx(network)
+
+                self.assertLessEqual(abs(num_rx - num_tx/ratio), 0.02*num_tx + 1)
+                for n, num_transmitters in network.nodes(data='num_transmitters'):
+                    if num_transmitters:
+                        self.assertTrue(any(network.nodes[rx]['num_receivers'] 
+                                            for rx in network.adj[n]))
+
+    def test_seed(self):
+        network, emb = configure_network(network_size=8, seed=42)
+        same_network, same_emb = configure_network(network_size=8, seed=42)
+
+        self.assertEqual(list(network.nodes(data=True)),
+                         list(same_network.nodes(data=True)))
+        self.assertEqual(emb, same_emb)
+
+class TestSimulateSignals(unittest.TestCase):
+
+    def setUp(self):
+        network, _ = configure_network(network_size=5)
+        self.channels, self.channel_power = create_channels(network)
+
+    def test_given_symbols(self):
+        num_tx = self.channels.shape[1]
+        symbols = np.resize([1, -1], (num_tx, 1))
+
+        y, transmitted_symbols = simulate_signals(
+            self.channels, self.channel_power, transmitted_symbols=symbols)
+
+        np.testing.assert_array_equal(transmitted_symbols, symbols)
+        np.testing.assert_allclose(y, self.channels @ symbols)
+
+    def test_seed(self):
+        y, transmitted_symbols = simulate_signals(
+            self.channels, self.channel_power, SNRb=5, seed=42)
+        same_y, same_symbols = simulate_signals(
+            self.channels, self.channel_power, SNRb=5, seed=42)
+
+        np.testing.assert_array_equal(transmitted_symbols, same_symbols)
+        np.testing.assert_array_equal(y, same_y)
+
+    def test_seeded_noise_independent_of_symbols(self):
+        symbols, noise = [], []
+        for seed in range(2000):
+            y, transmitted_symbols = simulate_signals(
+                self.channels, self.channel_power, SNRb=5, seed=seed)
+            symbols.append(transmitted_symbols[:16, 0])
+            noise.append(np.abs(y - self.channels @ transmitted_symbols)[:16, 0])
+
+        corr = np.corrcoef(np.array(symbols), np.array(noise), rowvar=False)[:16, 16:]
+        self.assertLess(np.abs(corr).max(), 0.15)
+
+class TestCreateBQM(unittest.TestCase):
+
+    def test_matches_coordinated_multipoint(self):
+        for network_size, snr in [(3, 5), (5, float('inf')), (8, 5)]:
+            with self.subTest(network_size=network_size, snr=snr):
+                network, _ = configure_network(network_size=network_size)
+                channels, channel_power = create_channels(network)
+                y, transmitted_symbols = simulate_signals(
+                    channels, channel_power, SNRb=snr)
+
+                bqm = _create_bqm(channels, y)
+                ref_bqm = dimod.generators.wireless.coordinated_multipoint(
+                    network, 
+                    modulation='BPSK', 
+                    transmitted_symbols=transmitted_symbols, 
+                    F_distribution=('binary','real'), 
+                    F=channels,
+                    y=y)
+
+                self.assertTrue(bqm.is_almost_equal(ref_bqm))
+
+class TestCreateFilters(unittest.TestCase):
+
+    def test_matches_linear_filter(self):
+        network, _ = configure_network(network_size=5)
+        channels, _ = create_channels(network)
+
+        for snr in [float('inf'), 3.0]:
+            filters = create_filters(channels, methods=ALL_METHODS, snr_over_nt=snr)
+            for method in ALL_METHODS:
+                with self.subTest(snr=snr, method=method):
+                    ref_filter = dimod.generators.wireless.linear_filter(
+                        channels, method=method, SNRoverNt=snr)
+
+                    np.testing.assert_allclose(
+                        filters[method], ref_filter, rtol=1e-5, atol=1e-6)
+
+                    # Requested alone, MMSE does not share the zero-forcing solve
+                    single = create_filters(channels, methods=[method], snr_over_nt=snr)
+                    np.testing.assert_allclose(
+                        single[method], ref_filter, rtol=1e-5, atol=1e-6)
+
+    def test_rank_deficient_channels(self):
+        network, _ = configure_network(network_size=5)
+        channels, _ = create_channels(network, F_distribution=('normal', 'real'))
+
+        # Receivers with proportional channels, and more receivers than transmitters
+        proportional = np.vstack((channels, 0.5*channels[:1]))
+        tall = channels[:, :channels.shape[0]//2]
+
+        for name, rank_deficient in [('proportional', proportional), ('tall', tall)]:
+            filters = create_filters(rank_deficient, methods=ALL_METHODS)
+            for method in ALL_METHODS:
+                with self.subTest(channels=name, method=method):
+                    ref_filter = dimod.generators.wireless.linear_filter(
+                        rank_deficient, method=method)
+
+                    np.testing.assert_allclose(
+                        filters[method], ref_filter, rtol=1e-5, atol=1e-6)
+
+    def test_solver_paths(self):
+        network, _ = configure_network(network_size=5)
+        channels, _ = create_channels(network)
+
+        # Unregularized filters take a pseudo-inverse; regularized MMSE is 
+        # solved by Cholesky factorization
+        for method, snr, factored in [('zero_forcing', float('inf'), False), 
+                                      ('MMSE', float('inf'), False), 
+                                      ('MMSE', 3.0, True)]:
+            with self.subTest(method=method, snr=snr):
+                with (mock.patch('scipy.linalg.cho_factor', 
+                                 wraps=scipy.linalg.cho_factor) as cho_factor, 
+                      mock.patch('numpy.linalg.pinv', 
+                                 wraps=np.linalg.pinv) as pinv):
+                    create_filters(channels, methods=[method], snr_over_nt=snr)
+
+                self.assertEqual(cho_factor.called, factored)
+                self.assertEqual(pinv.called, not factored)
+
+class TestApplyFilters(unittest.TestCase):
+
+    def test_reordered_and_subset_filters(self):
+        network, _ = configure_network(network_size=5)
+        channels, channel_power = create_channels(network)
+        y, _ = simulate_signals(channels, channel_power, SNRb=5)
+
+        filters = create_filters(channels, methods=ALL_METHODS)
+        reordered = {method: filters[method] for method in reversed(ALL_METHODS)}
+        subset = {'MMSE': filters['MMSE'], 'zero_forcing': filters['zero_forcing']}
+
+        for name, given in [('stacked', filters), ('reordered', reordered), ('subset', subset)]:
+            with self.subTest(filters=name):
+                # Filters that are not views of one stacked array in order are 
+                # stacked anew
+                with mock.patch('numpy.stack', wraps=np.stack) as stack:
+                    decoded = apply_filters(y, given)
+
+                self.assertEqual(stack.called, name != 'stacked')
+                self.assertEqual(list(decoded), list(given))
+                for method, signal in decoded.items():
+                    # Signs of values near zero depend on rounding
+                    filtered = np.real(given[method] @ y)[:, 0]
+                    clear = np.abs(filtered) > 1e-3
+                    np.testing.assert_array_equal(signal[clear], np.sign(filtered[clear]))
+
+class TestCompareSignals(unittest.TestCase):
+
+    def test_sampleset_out_of_label_order(self):
+        # Variables are recorded in the order 2, 0, 1; the lowest energy is 
+        # the second sample
+        sampleset = dimod.SampleSet.from_samples(
+            (np.array([[1, -1, 1], [-1, -1, 1]]), [2, 0, 1]), 'SPIN', 
+            energy=[0, -1], sort_labels=False)
+
+        self.assertEqual(compare_signals(
+            sampleset, np.array([[-1], [1], [-1]]), silence_printing=True), 100)
+        self.assertEqual(compare_signals(
+            sampleset, np.array([[-1], [-1], [1]]), silence_printing=True), 33)
+
+    def test_dict_of_signals(self):
+        transmission = np.array([[1], [-1], [1], [-1]])
+        signals = {'exact': np.array([1, -1, 1, -1]), 
+                   'half': np.array([1, 1, -1, -1]), 
+                   'none': np.array([-1, 1, -1, 1])}
+
+        self.assertEqual(compare_signals(signals, transmission, silence_printing=True), 
+                         {'exact': 100, 'half': 50, 'none': 0})
+        self.assertEqual(compare_signals({}, transmission, silence_printing=True), {})
+
+class TestTimeFilterInstantiation(unittest.TestCase):
+
+    def test_no_trials(self):
+        for n_trials in [0, -1]:
+            with self.subTest(n_trials=n_trials):
+                with self.assertRaises(ValueError):
+                    time_filter_instantiation([5], n_trials=n_trials)
+
+if __name__ == '__main__':
+    unittest.main()
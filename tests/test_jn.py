@@ -19,9 +19,8 @@ import unittest
 
 def run_jn(jn, timeout):
 
-    open_jn = open(jn, "r", encoding='utf-8')
-    notebook = nbformat.read(open_jn, nbformat.current_nbformat)
-    open_jn.close()
+    with open(jn, "r", encoding='utf-8') as open_jn:
+        notebook = nbformat.read(open_jn, nbformat.current_nbformat)
 
     preprocessor = ExecutePreprocessor(timeout=timeout, kernel_name='python3')
     preprocessor.allow_errors = True
@@ -46,13 +45,19 @@ def cell_text(nb, cell):
 jn_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 jn_file = os.path.join(jn_dir, '01-coordinated-multipoint.ipynb')
 
+@unittest.skipIf(os.getenv('SKIP_INT_TESTS'), "Skipping integration test.")
 class TestJupyterNotebook(unittest.TestCase):
-    @unittest.skipIf(os.getenv('SKIP_INT_TESTS'), "Skipping integration test.")
+
+    MAX_RUN_TIME = 150      # Runtime on my laptop is 65 seconds
+
+    @classmethod
+    def setUpClass(cls):
+        # Execute the notebook once for all tests of the class
+        cls.nb = run_jn(jn_file, cls.MAX_RUN_TIME)
+
     def test_jn(self):
-        
-        MAX_RUN_TIME = 150      # Runtime on my laptop is 65 seconds
 
-        nb = run_jn(jn_file, MAX_RUN_TIME)
+        nb = self.nb
         errors = collect_jn_errors(nb)
 
         # Smoketest